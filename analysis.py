@@ -0,0 +1,221 @@
+import sys, os, copy, time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import parse
+from p1 import PACMAN, WALL
+from p3 import MultiGhostBoard
+from p5 import MinimaxGame
+from p6 import ExpectiMaxGame
+from symmetry import LayoutSymmetry
+from distance_field import MazeDistances
+
+
+class LRUCache:
+    """
+    A dict with a bounded number of entries, the least recently used entry is evicted first
+    """
+    def __init__(self, max_size=1000000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class CachedEvaluation:
+    """
+    Mixin for the search games, leaf evaluations are looked up in a cache shared by all analyzed positions.
+    The key holds everything the evaluation depends on: the walls, pacman, ghosts, food and evaluation_context.
+    With a symmetry, the evaluation is shared by all the images of a state, as it only depends on distances.
+    """
+    cache = None
+    layout_key = None
+    symmetry = None
+
+    def evaluate(self, board):
+        if self.symmetry:
+            state_key, _ = self.symmetry.canonical(board.pacman_pos, board.ghost_pos_dict, board.food_pos_list)
+        else:
+            state_key = (board.pacman_pos, tuple(sorted(board.ghost_pos_dict.values())), tuple(board.food_pos_list))
+        key = (self.__class__.__name__, self.layout_key, state_key) + self.evaluation_context(board)
+        if key in self.cache:
+            return self.cache.get(key)
+        value = super().evaluate(board)
+        self.cache.put(key, value)
+        return value
+
+    def evaluation_context(self, board):
+        return ()
+
+
+class CachedMinimaxGame(CachedEvaluation, MinimaxGame):
+    pass
+
+
+class CachedExpectiMaxGame(CachedEvaluation, ExpectiMaxGame):
+    def evaluation_context(self, board):
+        # expecti-max rewards the food eaten since the root and punishes revisiting positions
+        return len(self.board.food_pos_list), self.visited_positions.count(board.pacman_pos)
+
+
+# engine name -> game class
+ANALYSIS_ENGINES = {
+    'minimax': CachedMinimaxGame,
+    'expectimax': CachedExpectiMaxGame,
+}
+
+
+class Analyzer:
+    """
+    Search many positions with one game object per engine and a cache shared across the positions.
+    A position is a dict like the output of parse.read_layout_problem, with an optional 'player' (pacman by default)
+    and an optional 'food' list, as the grid does not show the food under a ghost.
+
+    With symmetry, states are mapped to a canonical form under the mirrors and rotations of the walls before the
+    cache lookup, and the cached best move is mapped back. Between equally good moves, a cached result may then
+    return another one than a fresh search of the position.
+    """
+    def __init__(self, cache_size=1000000, symmetry=False):
+        self.cache = LRUCache(cache_size)
+        self.games = {}
+        self.symmetry = symmetry
+
+    def get_game(self, engine, depth, board):
+        if engine not in self.games:
+            game = ANALYSIS_ENGINES[engine](board, depth)
+            game.cache = self.cache
+            self.games[engine] = game
+        game = self.games[engine]
+        # reuse the game object, only reset the state of the last position
+        game.board = board
+        game.depth = depth
+        game.winner = None
+        game.visited_positions = []
+        layout_key = tuple(''.join(WALL if cell == WALL else ' ' for cell in row) for row in board.board)
+        if layout_key != game.layout_key:
+            game.layout_key = layout_key
+            game.wall_count = game.count_wall()
+            game.maze = MazeDistances.for_grid(board.board)
+            game.symmetry = LayoutSymmetry(layout_key) if self.symmetry else None
+        return game
+
+    def analyze(self, position, engine, depth):
+        """
+        search a single position, return the best move and its value
+        """
+        board = MultiGhostBoard(copy.deepcopy(position['board']))
+        if 'food' in position:
+            board.food_pos_list = list(position['food'])
+        player = position.get('player', PACMAN)
+        game = self.get_game(engine, depth, board)
+        if game.symmetry:
+            state_key, transform = game.symmetry.canonical(board.pacman_pos, board.ghost_pos_dict,
+                                                           board.food_pos_list)
+        else:
+            state_key, transform = (board.pacman_pos, tuple(board.ghost_pos_dict.items()),
+                                    tuple(board.food_pos_list)), None
+        key = (engine, depth, player, game.layout_key, state_key)
+        result = self.cache.get(key)
+        if result is not None:
+            # the cached best move is in the frame of the canonical state
+            if transform:
+                result = dict(result, best_move=transform.unmap_direction(result['best_move']))
+            return dict(result, cached=True)
+
+        game.player = player
+        state = game.get_state(board, depth, player)
+        if engine == 'minimax':
+            search = game.minimax_pacman if player == PACMAN else game.minimax_ghost
+            value = search(state, float('-inf'), float('inf'))
+        else:
+            search = game.expecti_pacman if player == PACMAN else game.expecti_ghost
+            value = search(state)
+        result = {'best_move': state['best_move'], 'value': value}
+        if transform:
+            self.cache.put(key, dict(result, best_move=transform.map_direction(result['best_move'])))
+        else:
+            self.cache.put(key, result)
+        return dict(result, cached=False)
+
+
+# the analyzer of a worker process, its cache is shared by all the chunks the worker gets
+_worker_analyzer = None
+
+
+def analyze_chunk(chunk, engine, depth, cache_size, symmetry):
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = Analyzer(cache_size, symmetry)
+    return [dict(_worker_analyzer.analyze(position, engine, depth), index=index) for index, position in chunk]
+
+
+def analyze_many(positions, engine, depth, workers=0, chunk_size=64, cache_size=1000000, symmetry=False):
+    """
+    search a stream of positions and yield a result dict per position as soon as it is ready:
+    index (the position in the stream), best_move, value and whether the result came from the cache
+
+    with workers=0 the positions are searched in this process in order, sharing one cache,
+    otherwise chunks of positions are searched by a process pool, where every worker keeps its own cache
+    and results are yielded in the order they complete
+    with symmetry, symmetric states share their cache entries (see Analyzer)
+    """
+    if not workers:
+        analyzer = Analyzer(cache_size, symmetry)
+        for index, position in enumerate(positions):
+            yield dict(analyzer.analyze(position, engine, depth), index=index)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        chunk = []
+        for index, position in enumerate(positions):
+            chunk.append((index, position))
+            if len(chunk) == chunk_size:
+                pending.add(pool.submit(analyze_chunk, chunk, engine, depth, cache_size, symmetry))
+                chunk = []
+            # bound the number of chunks in flight, so the stream is never read into memory
+            while len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        if chunk:
+            pending.add(pool.submit(analyze_chunk, chunk, engine, depth, cache_size, symmetry))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from future.result()
+
+
+if __name__ == "__main__":
+    # python analysis.py problem_id engine depth workers: analyze all test cases of a problem
+    problem_id = int(sys.argv[1])
+    engine = sys.argv[2]
+    depth = int(sys.argv[3])
+    workers = int(sys.argv[4])
+    path = os.path.join('test_cases', 'p' + str(problem_id))
+    names = sorted(name for name in os.listdir(path) if name.endswith('.prob'))
+    positions = [parse.read_layout_problem(os.path.join(path, name)) for name in names]
+    start = time.time()
+    for result in analyze_many(positions, engine, depth, workers):
+        print(names[result['index']], result['best_move'], result['value'])
+    end = time.time()
+    print('time: ', end - start)
@@ -0,0 +1,112 @@
+from abc import ABC, abstractmethod
+from collections import deque, OrderedDict
+from p1 import DIRECTIONS, WALL
+
+# layout key -> MazeDistances, the games on the same layout share the distance fields
+# the fields of a layout grow to O(open cells ** 2), so only the most recently used layouts are kept
+MAX_CACHED_MAZES = 8
+_maze_cache = OrderedDict()
+
+
+class Distances(ABC):
+    """
+    A source of maze distances between open cells: the cached fields of a process, or the table of a shared layout.
+    The evaluations only use closest_distance, so any source can be given to a game.
+    """
+    @abstractmethod
+    def distance(self, pos1, pos2):
+        """
+        maze distance between two open cells, inf if they are not connected
+        """
+
+    def closest_distance(self, pos, target_pos_list):
+        """
+        the same as MinimaxGame.calculate_bfs(board, pos, target_pos_list) if the targets don't block each other
+        """
+        closest_distance = float('inf')
+        for target_pos in target_pos_list:
+            distance = self.distance(pos, target_pos)
+            if distance < closest_distance:
+                closest_distance = distance
+        return closest_distance
+
+
+class MazeDistances(Distances):
+    """
+    Distance fields of a maze: the field of a cell holds the maze distance from that cell to every open cell.
+    The walls never change, so a field is computed by one bfs the first time it is needed and then kept.
+    Ghosts don't block the fields, like the bfs of the evaluations, which stops at the first ghost it reaches.
+    """
+    def __init__(self, grid):
+        # open cells in row-major order
+        self.cell_index = {(row, col): None for row in range(len(grid)) for col in range(len(grid[0]))
+                           if grid[row][col] != WALL}
+        for index, pos in enumerate(self.cell_index):
+            self.cell_index[pos] = index
+        self.cells = list(self.cell_index)
+        self.neighbors = [[self.cell_index[(row + d_row, col + d_col)] for d_row, d_col in DIRECTIONS.values()
+                           if (row + d_row, col + d_col) in self.cell_index] for row, col in self.cells]
+        self.fields = [None] * len(self.cells)
+
+    @classmethod
+    def for_grid(cls, grid):
+        key = tuple(''.join(WALL if cell == WALL else ' ' for cell in row) for row in grid)
+        if key in _maze_cache:
+            _maze_cache.move_to_end(key)
+        else:
+            _maze_cache[key] = cls(key)
+            if len(_maze_cache) > MAX_CACHED_MAZES:
+                _maze_cache.popitem(last=False)
+        return _maze_cache[key]
+
+    def field(self, pos):
+        index = self.cell_index[pos]
+        if self.fields[index] is None:
+            distances = [float('inf')] * len(self.cells)
+            distances[index] = 0
+            queue = deque([index])
+            while queue:
+                current = queue.popleft()
+                for neighbor in self.neighbors[current]:
+                    if distances[neighbor] == float('inf'):
+                        distances[neighbor] = distances[current] + 1
+                        queue.append(neighbor)
+            self.fields[index] = distances
+        return self.fields[index]
+
+    def distance(self, pos1, pos2):
+        return self.field(pos2)[self.cell_index[pos1]]
+
+
+class GhostDistanceField:
+    """
+    The maze distance from a cell to the closest ghost, kept up to date as the ghosts move.
+    Every ghost points to the cached field of its cell, so a move swaps one field and needs no bfs once a ghost
+    has been on that cell, and a lookup takes the minimum over the fields of the ghosts at one cell.
+    Merging the fields over all the open cells costs about 100us per move in python, much more than the few
+    lookups of a pacman turn, so the minimum is only taken for the cells that are looked up.
+    """
+    def __init__(self, board):
+        self.maze = MazeDistances.for_grid(board.board)
+        self.ghost_pos_dict = dict(board.ghost_pos_dict)
+        self.fields = [self.maze.field(pos) for pos in self.ghost_pos_dict.values()]
+
+    def sync(self, ghost_pos_dict):
+        """
+        apply the moves of all the ghosts since the last sync, then swap the fields once
+        """
+        moved = False
+        for ghost, pos in ghost_pos_dict.items():
+            if self.ghost_pos_dict[ghost] != pos:
+                self.ghost_pos_dict[ghost] = pos
+                moved = True
+        if moved:
+            self.fields = [self.maze.field(pos) for pos in self.ghost_pos_dict.values()]
+
+    def distance(self, pos):
+        index = self.maze.cell_index[pos]
+        closest_distance = float('inf')
+        for field in self.fields:
+            if field[index] < closest_distance:
+                closest_distance = field[index]
+        return closest_distance
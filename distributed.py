@@ -0,0 +1,251 @@
+import sys, os, time, json, socket, socketserver, threading, itertools
+from collections import deque
+from multiprocessing import Process
+import parse
+from p4 import better_play_multiple_ghosts
+from p6 import expecti_max_multiple_ghosts
+
+# engine name -> play function of a problem and a depth, returning (solution, winner)
+ENGINES = {
+    'smart_multi_ghost': lambda problem, depth: better_play_multiple_ghosts(problem),
+    'expectimax': expecti_max_multiple_ghosts,
+}
+
+
+def play_batch(batch):
+    """
+    worker task: play the games of a batch, return the winner of every seed
+    """
+    play = ENGINES[batch['engine']]
+    winners = []
+    for seed in range(batch['seed_start'], batch['seed_stop']):
+        problem = {'seed': seed, 'board': [list(row) for row in batch['layout']]}
+        _, winner = play(problem, batch['depth'])
+        winners.append(winner)
+    return winners
+
+
+def send(stream, message):
+    stream.write(json.dumps(message) + '\n')
+    stream.flush()
+
+
+def receive(stream):
+    line = stream.readline()
+    return json.loads(line) if line else None
+
+
+class Coordinator:
+    """
+    Hand out batches of (layout, seed range, engine, depth) to workers over TCP and collect the winners.
+    Workers pull a batch, play it and push back the winners, one JSON message per line.
+    A batch is queued again if its worker disconnects or doesn't answer within lease seconds,
+    and only the first result of a batch is kept. The results are merged by batch id, so they don't depend
+    on which worker played which batch or in which order.
+    """
+    def __init__(self, jobs, batch_size=10, host='localhost', port=0, lease=600):
+        self.batches = []
+        for layout, seeds, engine, depth in jobs:
+            for start in range(seeds.start, seeds.stop, batch_size):
+                self.batches.append({'id': len(self.batches), 'layout': [''.join(row) for row in layout],
+                                     'seed_start': start, 'seed_stop': min(start + batch_size, seeds.stop),
+                                     'engine': engine, 'depth': depth})
+        self.lease = lease
+        self.queue = deque(batch['id'] for batch in self.batches)
+        # batch id -> (id of the worker connection holding the lease, time the batch was handed out)
+        self.assigned = {}
+        self.worker_ids = itertools.count()
+        self.results = {}
+        self.requeued = 0
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        if not self.batches:
+            self.done.set()
+        coordinator = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                with self.request.makefile('r') as reader, self.request.makefile('w') as writer:
+                    coordinator.serve_worker(reader, writer)
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+
+    def serve_worker(self, reader, writer):
+        worker_id = next(self.worker_ids)
+        batch_id = None
+        try:
+            while True:
+                message = receive(reader)
+                if message is None:
+                    break
+                if message['type'] == 'result':
+                    self.record(message['batch'], message['winners'], worker_id)
+                    batch_id = None
+                reply = self.next_batch(worker_id)
+                if reply['type'] == 'batch':
+                    batch_id = reply['batch']['id']
+                send(writer, reply)
+        except (OSError, ValueError):
+            pass
+        finally:
+            # the worker is gone, its batch goes back to the queue
+            if batch_id is not None:
+                self.release(batch_id, worker_id)
+
+    def next_batch(self, worker_id):
+        with self.lock:
+            self.expire_leases()
+            if self.done.is_set():
+                return {'type': 'done'}
+            if not self.queue:
+                return {'type': 'wait'}
+            batch_id = self.queue.popleft()
+            self.assigned[batch_id] = (worker_id, time.time())
+            return {'type': 'batch', 'batch': self.batches[batch_id]}
+
+    def expire_leases(self):
+        now = time.time()
+        for batch_id, (_, assigned_at) in list(self.assigned.items()):
+            if now - assigned_at > self.lease:
+                del self.assigned[batch_id]
+                if batch_id not in self.results:
+                    self.queue.append(batch_id)
+                    self.requeued += 1
+
+    def holds_lease(self, batch_id, worker_id):
+        """
+        a batch is handed out again when its lease expires, only the worker holding the current lease owns it
+        """
+        return batch_id in self.assigned and self.assigned[batch_id][0] == worker_id
+
+    def release(self, batch_id, worker_id):
+        with self.lock:
+            if self.holds_lease(batch_id, worker_id):
+                del self.assigned[batch_id]
+                if batch_id not in self.results:
+                    self.queue.append(batch_id)
+                    self.requeued += 1
+
+    def record(self, batch_id, winners, worker_id):
+        with self.lock:
+            # a late result of an expired lease doesn't end the lease of the worker playing the batch now
+            if self.holds_lease(batch_id, worker_id):
+                del self.assigned[batch_id]
+            if batch_id in self.queue:
+                self.queue.remove(batch_id)
+            if batch_id not in self.results:
+                self.results[batch_id] = winners
+            if len(self.results) == len(self.batches):
+                self.done.set()
+
+    def run(self, timeout=None):
+        """
+        serve until every batch has a result, return the merged results
+        """
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            if not self.done.wait(timeout):
+                raise TimeoutError(f'{len(self.results)} of {len(self.batches)} batches finished')
+        finally:
+            self.server.shutdown()
+            self.server.server_close()
+        return self.merge()
+
+    def merge(self):
+        """
+        the winner of every game in batch order, and the win counts per (layout, engine, depth)
+        """
+        games = []
+        summary = {}
+        for batch in self.batches:
+            key = ('\n'.join(batch['layout']), batch['engine'], batch['depth'])
+            wins, count = summary.get(key, (0, 0))
+            for seed, winner in zip(range(batch['seed_start'], batch['seed_stop']), self.results[batch['id']]):
+                games.append((batch['id'], seed, winner))
+                wins += winner == 'Pacman'
+                count += 1
+            summary[key] = (wins, count)
+        return {'games': games, 'summary': summary, 'requeued': self.requeued}
+
+
+def run_worker(host, port, retries=50, wait=0.2):
+    """
+    pull batches from the coordinator until it reports done or goes away, return the number of played batches
+    """
+    for _ in range(retries):
+        try:
+            connection = socket.create_connection((host, port))
+            break
+        except OSError:
+            time.sleep(wait)
+    else:
+        return 0
+    played = 0
+    with connection, connection.makefile('r') as reader, connection.makefile('w') as writer:
+        message = {'type': 'pull'}
+        while True:
+            try:
+                send(writer, message)
+                reply = receive(reader)
+            except OSError:
+                break
+            if reply is None or reply['type'] == 'done':
+                break
+            if reply['type'] == 'wait':
+                time.sleep(wait)
+                message = {'type': 'pull'}
+                continue
+            batch = reply['batch']
+            message = {'type': 'result', 'batch': batch['id'], 'winners': play_batch(batch)}
+            played += 1
+    return played
+
+
+def run_local(jobs, workers=4, batch_size=10, timeout=None):
+    """
+    the localhost reference setup: a coordinator on a free port and worker processes on the same machine
+    """
+    coordinator = Coordinator(jobs, batch_size=batch_size)
+    host, port = coordinator.address
+    processes = [Process(target=run_worker, args=(host, port)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        return coordinator.run(timeout)
+    finally:
+        for process in processes:
+            process.join(5)
+            if process.is_alive():
+                process.terminate()
+
+
+if __name__ == "__main__":
+    # python distributed.py local engine test_case_id num_games depth workers
+    # python distributed.py coordinator engine test_case_id num_games depth port
+    # python distributed.py worker host port
+    mode = sys.argv[1]
+    if mode == 'worker':
+        print('batches:', run_worker(sys.argv[2], int(sys.argv[3])))
+        sys.exit()
+    engine, test_case_id, num_games, depth = sys.argv[2], int(sys.argv[3]), int(sys.argv[4]), int(sys.argv[5])
+    problem_id = 6 if engine == 'expectimax' else 4
+    path = os.path.join('test_cases', 'p' + str(problem_id), str(test_case_id) + '.prob')
+    jobs = [(parse.read_layout_problem(path)['board'], range(1, num_games + 1), engine, depth)]
+    print('engine:', engine)
+    print('test_case_id:', test_case_id)
+    print('num_games:', num_games)
+    start = time.time()
+    if mode == 'local':
+        result = run_local(jobs, workers=int(sys.argv[6]))
+    else:
+        coordinator = Coordinator(jobs, host='0.0.0.0', port=int(sys.argv[6]))
+        print('listening on', coordinator.address)
+        result = coordinator.run()
+    end = time.time()
+    wins, games = next(iter(result['summary'].values()))
+    print('time: ', end - start)
+    print('requeued batches:', result['requeued'])
+    print('win %', wins / games * 100)
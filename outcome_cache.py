@@ -0,0 +1,149 @@
+import re, json, time, hashlib, sqlite3, zlib
+
+DEFAULT_CACHE_PATH = 'outcome_cache.sqlite'
+# longer traces are not stored, only their outcome
+MAX_TRACE_BYTES = 1 << 20
+
+
+def layout_hash(board):
+    return hashlib.sha256('\n'.join(''.join(row) for row in board).encode()).hexdigest()
+
+
+def weights_version(weights):
+    """
+    a short hash of the evaluation weights, a game played with other weights is another game
+    """
+    return hashlib.sha256(json.dumps(weights or {}, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def summarize(solution):
+    """
+    the winner, the final score and the number of steps of a solution
+    """
+    steps = re.findall(r'^(\d+): ', solution, re.MULTILINE)
+    scores = re.findall(r'^score: (-?\d+)', solution, re.MULTILINE)
+    winner = solution.rsplit('WIN: ', 1)[1] if 'WIN: ' in solution else None
+    return winner, int(scores[-1]) if scores else 0, int(steps[-1]) if steps else 0
+
+
+class TraceWriter:
+    """
+    Compress a trace frame by frame while the game is played, so the trace of a cached game is never held in memory.
+    Only the compressed trace is kept, and it is dropped once it is longer than max_bytes.
+    """
+    def __init__(self, max_bytes=MAX_TRACE_BYTES):
+        self.max_bytes = max_bytes
+        self.compressor = zlib.compressobj()
+        self.chunks = []
+        self.size = 0
+        # the last two frames hold the step, the score and the winner of a finished game
+        self.recent = ('', '')
+
+    def write(self, frame):
+        self.recent = (self.recent[1], frame)
+        if self.chunks is None:
+            return
+        chunk = self.compressor.compress(frame.encode())
+        self.size += len(chunk)
+        if self.size > self.max_bytes:
+            self.chunks = None
+        else:
+            self.chunks.append(chunk)
+
+    def summary(self):
+        return summarize(''.join(self.recent))
+
+    def finish(self):
+        """
+        return the compressed trace, or None if it was too long
+        """
+        if self.chunks is None:
+            return None
+        # the compressor buffers a bounded amount of output until the flush
+        self.chunks.append(self.compressor.flush())
+        if self.size + len(self.chunks[-1]) > self.max_bytes:
+            return None
+        return b''.join(self.chunks)
+
+
+class OutcomeCache:
+    """
+    An opt-in cache of game outcomes in a SQLite file, so repeated sweeps don't simulate the same game again.
+    A game is keyed by (layout hash, seed, engine, depth, weights version) and the value is the winner, the score,
+    the number of steps and optionally the zlib compressed trace.
+    Only seeded games are cached: with seed -1 the games are not reproducible.
+    The least recently used games are evicted once there are more than max_entries.
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_entries=100000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS outcomes (layout TEXT, seed INTEGER, engine TEXT, depth INTEGER, '
+            'weights TEXT, winner TEXT, score INTEGER, steps INTEGER, trace BLOB, last_used INTEGER, '
+            'PRIMARY KEY (layout, seed, engine, depth, weights))')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS outcomes_last_used ON outcomes (last_used)')
+
+    def key(self, problem, engine, depth=None, weights=None):
+        """
+        return None if the game can't be cached
+        """
+        if problem['seed'] == -1:
+            return None
+        # games without a depth parameter are stored with depth -1
+        return layout_hash(problem['board']), problem['seed'], engine, -1 if depth is None else depth, \
+            weights_version(weights)
+
+    def get(self, key):
+        """
+        return a dict with winner, score, steps and trace (None if it was not stored), or None on a miss
+        """
+        row = self.connection.execute(
+            'SELECT winner, score, steps, trace FROM outcomes WHERE layout = ? AND seed = ? AND engine = ? '
+            'AND depth = ? AND weights = ?', key).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self.connection:
+            self.connection.execute(
+                'UPDATE outcomes SET last_used = ? WHERE layout = ? AND seed = ? AND engine = ? AND depth = ? '
+                'AND weights = ?', (time.time_ns(),) + key)
+        winner, score, steps, trace = row
+        return {'winner': winner, 'score': score, 'steps': steps,
+                'trace': zlib.decompress(trace).decode() if trace is not None else None}
+
+    def put(self, key, winner, score, steps, trace=None, compressed_trace=None):
+        """
+        the trace is given as text, or already compressed by a TraceWriter
+        """
+        compressed = zlib.compress(trace.encode()) if trace is not None else compressed_trace
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO outcomes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    key + (winner, score, steps, compressed, time.time_ns()))
+            count = self.connection.execute('SELECT COUNT(*) FROM outcomes').fetchone()[0]
+            if count > self.max_entries:
+                self.connection.execute(
+                    'DELETE FROM outcomes WHERE rowid IN (SELECT rowid FROM outcomes ORDER BY last_used LIMIT ?)',
+                    (count - self.max_entries,))
+
+    def play(self, problem, engine, play_game, depth=None, weights=None):
+        """
+        return (solution, winner) of play_game() from the cache, or play the game and store it
+        """
+        key = self.key(problem, engine, depth, weights)
+        if key is not None:
+            outcome = self.get(key)
+            if outcome is not None and outcome['trace'] is not None:
+                return outcome['trace'], outcome['winner']
+        solution, winner = play_game()
+        if key is not None:
+            _, score, steps = summarize(solution)
+            self.put(key, winner, score, steps, solution)
+        return solution, winner
+
+    def close(self):
+        self.connection.close()
+
@@ -1,4 +1,6 @@
-import sys, random, grader, parse
+import sys, copy, random, trace_grader, parse
+from outcome_cache import OutcomeCache
+from parse import pop_flag
 
 DIRECTIONS = {
     'N': (-1, 0),
@@ -34,6 +36,28 @@ class Board:
         # use a dict here for solving multi-ghost questions easier later
         self.ghost_pos_dict = self.find_ghost_pos_dict()
         self.food_pos_list = self.find_food_pos_list()
+        # cached row strings for __str__, built by the first __str__, then update_board marks the rows it touches
+        self.row_strings = None
+        self.dirty_rows = set()
+        self.frame = None
+        # cells changed since the last delta frame, only recorded for games with delta frames
+        self.track_changes = False
+        self.changed_cells = set()
+
+    def __deepcopy__(self, memo):
+        """
+        the search copies the board at every node, the render caches are not copied but start empty
+        """
+        board = self.__class__.__new__(self.__class__)
+        memo[id(self)] = board
+        for name, value in self.__dict__.items():
+            if name not in ('row_strings', 'dirty_rows', 'frame', 'changed_cells'):
+                setattr(board, name, copy.deepcopy(value, memo))
+        board.row_strings = None
+        board.dirty_rows = set()
+        board.frame = None
+        board.changed_cells = set()
+        return board
 
     def find_pacman_pos(self):
         return self.find_entity_pos(PACMAN)
@@ -93,9 +117,39 @@ class Board:
             self.board[new_pos[0]][new_pos[1]] = self.board[new_pos[0]][new_pos[1]]
         else:
             self.board[new_pos[0]][new_pos[1]] = entity
+        self.touch(pos, new_pos)
+
+    def touch(self, pos, new_pos):
+        """
+        invalidate the render caches of two cells changed by a move
+        """
+        if self.row_strings is not None:
+            self.dirty_rows.update((pos[0], new_pos[0]))
+        if self.track_changes:
+            self.changed_cells.update((pos, new_pos))
 
     def __str__(self):
-        return '\n'.join(''.join(row) for row in self.board) + '\n'
+        """
+        a move changes at most two cells, so only the dirty rows are joined again
+        """
+        if self.row_strings is None:
+            self.row_strings = [''.join(row) for row in self.board]
+            self.dirty_rows.clear()
+            self.frame = None
+        if self.frame is None or self.dirty_rows:
+            for row in self.dirty_rows:
+                self.row_strings[row] = ''.join(self.board[row])
+            self.dirty_rows.clear()
+            self.frame = '\n'.join(self.row_strings) + '\n'
+        return self.frame
+
+    def render_delta(self):
+        """
+        only the cells changed since the last delta frame, one 'row col char' line per cell
+        """
+        delta = ''.join(f'{row} {col} {self.board[row][col]}\n' for row, col in sorted(self.changed_cells))
+        self.changed_cells.clear()
+        return delta
 
 
 class Game:
@@ -103,8 +157,13 @@ class Game:
     Basic class for pacman game, implement the moving logic
     both the pacman and ghost move randomly
     """
-    def __init__(self, board):
+    def __init__(self, board, delta_frames=False, trace_sink=None):
         self.board = board
+        # print only the changed cells after every move instead of the whole board
+        self.delta_frames = delta_frames
+        board.track_changes = delta_frames
+        # if given, every frame is passed to trace_sink instead of being added to the returned solution
+        self.trace_sink = trace_sink
         self.score = 0
         self.steps_count = 0
         self.winner = None
@@ -183,20 +242,34 @@ class Game:
         return self.generate_state(self.player, direction)
 
     def generate_initial_state(self, seed):
-        return f"seed: {seed}\n0\n{self.board}"
+        # the delta frames start from the initial board
+        self.board.changed_cells.clear()
+        return self.emit(f"seed: {seed}\n0\n{self.board}")
 
     def generate_state(self, player, direction):
         self.steps_count += 1
-        return f"{self.steps_count}: {player} moving {direction}\n{self.board}score: {self.score}\n"
+        frame = self.board.render_delta() if self.delta_frames else self.board
+        return self.emit(f"{self.steps_count}: {player} moving {direction}\n{frame}score: {self.score}\n")
+
+    def emit(self, frame):
+        """
+        return the frame to be added to the solution, or hand it to the trace sink
+        the sink may raise to stop the game, e.g. when the frame doesn't match the expected solution
+        """
+        if self.trace_sink is None:
+            return frame
+        self.trace_sink(frame)
+        return ''
 
 
-def random_play_single_ghost(problem):
+def random_play_single_ghost(problem, delta_frames=False, trace_sink=None):
     board = Board(problem['board'])
-    game = Game(board)
+    game = Game(board, delta_frames, trace_sink)
     return game.play_game_randomly(problem['seed'])
 
 
 if __name__ == "__main__":
+    cache = OutcomeCache() if pop_flag(sys.argv, '--cache') else None
     test_case_id = int(sys.argv[1])
     problem_id = 1
-    grader.grade(problem_id, test_case_id, random_play_single_ghost, parse.read_layout_problem)
+    trace_grader.grade(problem_id, test_case_id, random_play_single_ghost, parse.read_layout_problem, cache)
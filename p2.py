@@ -1,8 +1,12 @@
 import sys, parse
+from profiler import Profiler
+from parse import pop_flag, pop_option
+from outcome_cache import OutcomeCache
 import time, os, copy
 from p1 import Board, Game
 from p1 import PACMAN, GHOST
 import random
+from distance_field import GhostDistanceField
 
 
 def calculate_manhattan_distance(pos1, pos2):
@@ -13,6 +17,12 @@ class SmartGame(Game):
     """
     Smart pacman game, pacman will choose the best move based on an evaluation function
     """
+    # weights of the evaluation function, tuner.py can override them per game
+    weights = {'ghost': 1.5}
+    # measure the distance to the ghosts in the maze instead of by manhattan distance
+    maze_ghost_distance = False
+    ghost_field = None
+
     def play_game_smart(self, seed):
         if seed != -1:
             random.seed(seed, version=1)
@@ -53,7 +63,10 @@ class SmartGame(Game):
         """
         new_pacman_pos = self.board.move_by_direction(self.board.pacman_pos, direction)
 
-        distance_to_ghost = calculate_manhattan_distance(new_pacman_pos, self.board.ghost_pos_dict[GHOST])
+        if self.maze_ghost_distance:
+            distance_to_ghost = self.ghost_distance(new_pacman_pos)
+        else:
+            distance_to_ghost = calculate_manhattan_distance(new_pacman_pos, self.board.ghost_pos_dict[GHOST])
         # may have multiple food
         closest_to_food = float('inf')
         for food_pos in self.board.food_pos_list:
@@ -62,7 +75,16 @@ class SmartGame(Game):
                 closest_to_food = distance_to_food
         # minimize the distance to food and maximize the distance to the ghost
         # pacman will have a higher chance to win if it is far from the ghost, so give the ghost a higher weight
-        return -closest_to_food + 1.5 * distance_to_ghost
+        return -closest_to_food + self.weights['ghost'] * distance_to_ghost
+
+    def ghost_distance(self, pos):
+        """
+        the maze distance from pos to the closest ghost, from a distance field that follows the ghosts
+        """
+        if self.ghost_field is None:
+            self.ghost_field = GhostDistanceField(self.board)
+        self.ghost_field.sync(self.board.ghost_pos_dict)
+        return self.ghost_field.distance(pos)
 
 
 def better_play_single_ghosts(problem):
@@ -72,6 +94,13 @@ def better_play_single_ghosts(problem):
 
 
 if __name__ == "__main__":
+    profile = pop_flag(sys.argv, '--profile')
+    SmartGame.maze_ghost_distance = pop_flag(sys.argv, '--maze-distance')
+    # the games with maze distances are another engine for the outcome cache
+    engine = SmartGame.__name__ + ('-maze' if SmartGame.maze_ghost_distance else '')
+    cache = OutcomeCache() if pop_flag(sys.argv, '--cache') else None
+    # with a seed start, the i-th trial plays its own reproducible game with seed start + i
+    seed_start = pop_option(sys.argv, '--seed-start')
     test_case_id = int(sys.argv[1])
     problem_id = 2
     file_name_problem = str(test_case_id) + '.prob'
@@ -83,10 +112,20 @@ if __name__ == "__main__":
     print('test_case_id:', test_case_id)
     print('num_trials:', num_trials)
     print('verbose:', verbose)
+    profiler = Profiler(os.path.join('profiles', f'p{problem_id}_{test_case_id}'), enabled=profile)
     start = time.time()
     win_count = 0
     for i in range(num_trials):
-        solution, winner = better_play_single_ghosts(copy.deepcopy(problem))
+        if seed_start is not None:
+            problem['seed'] = seed_start + i
+        # the memory report plays the game again, without the cache
+        with profiler.game(i + 1, memory_run=lambda: better_play_single_ghosts(copy.deepcopy(problem))):
+            if cache:
+                solution, winner = cache.play(
+                    problem, engine, lambda: better_play_single_ghosts(copy.deepcopy(problem)),
+                    weights=SmartGame.weights)
+            else:
+                solution, winner = better_play_single_ghosts(copy.deepcopy(problem))
         if winner == 'Pacman':
             win_count += 1
         if verbose:
@@ -95,3 +134,7 @@ if __name__ == "__main__":
     end = time.time()
     print('time: ', end - start)
     print('win %', win_p)
+    if cache:
+        print('cache hits:', cache.hits)
+        cache.close()
+    profiler.save()
@@ -1,8 +1,10 @@
-import sys, grader, parse, math
+import sys, trace_grader, parse, math
 from p1 import Board, Game
 from p1 import DIRECTIONS
 from p1 import PACMAN, WALL
 import random
+from parse import pop_flag
+from outcome_cache import OutcomeCache
 
 
 class MultiGhostBoard(Board):
@@ -73,13 +75,14 @@ class MultiGhostGame(Game):
         return random.choice(self.board.get_valid_directions_in_order(ghost_pos))
 
 
-def random_play_multiple_ghosts(problem):
+def random_play_multiple_ghosts(problem, delta_frames=False, trace_sink=None):
     board = MultiGhostBoard(problem['board'])
-    game = MultiGhostGame(board)
+    game = MultiGhostGame(board, delta_frames, trace_sink)
     return game.play_game_randomly(problem['seed'])
 
 
 if __name__ == "__main__":
+    cache = OutcomeCache() if pop_flag(sys.argv, '--cache') else None
     test_case_id = int(sys.argv[1])
     problem_id = 3
-    grader.grade(problem_id, test_case_id, random_play_multiple_ghosts, parse.read_layout_problem)
+    trace_grader.grade(problem_id, test_case_id, random_play_multiple_ghosts, parse.read_layout_problem, cache)
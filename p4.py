@@ -1,4 +1,7 @@
 import sys, parse
+from profiler import Profiler
+from parse import pop_flag, pop_option
+from outcome_cache import OutcomeCache
 import time, os, copy
 from p1 import PACMAN
 from p2 import SmartGame
@@ -11,6 +14,8 @@ class SmartGameWithMultiGhost(MultiGhostGame, SmartGame):
     """
     Based on p3, we implement a smart pacman against multiple random ghosts.
     """
+    weights = {'ghost': 2}
+
     def play_game_smart(self, seed):
         # ensure random.choice in a fixed order
         if seed != -1:
@@ -45,11 +50,14 @@ class SmartGameWithMultiGhost(MultiGhostGame, SmartGame):
         """
         new_pacman_pos = self.board.move_by_direction(self.board.pacman_pos, direction)
 
-        closest_to_ghost = float('inf')
-        for ghost_pos in self.board.ghost_pos_dict.values():
-            distance_to_ghost = calculate_manhattan_distance(new_pacman_pos, ghost_pos)
-            if distance_to_ghost < closest_to_ghost:
-                closest_to_ghost = distance_to_ghost
+        if self.maze_ghost_distance:
+            closest_to_ghost = self.ghost_distance(new_pacman_pos)
+        else:
+            closest_to_ghost = float('inf')
+            for ghost_pos in self.board.ghost_pos_dict.values():
+                distance_to_ghost = calculate_manhattan_distance(new_pacman_pos, ghost_pos)
+                if distance_to_ghost < closest_to_ghost:
+                    closest_to_ghost = distance_to_ghost
 
         closest_to_food = float('inf')
         for food_pos in self.board.food_pos_list:
@@ -58,7 +66,7 @@ class SmartGameWithMultiGhost(MultiGhostGame, SmartGame):
                 closest_to_food = distance_to_food
         # minimize the distance to food and maximize the distance to the ghost
         # pacman will have a higher chance to win if it is far from the ghost, so give the ghost a higher weight
-        return -closest_to_food + 2 * closest_to_ghost
+        return -closest_to_food + self.weights['ghost'] * closest_to_ghost
 
 
 def better_play_multiple_ghosts(problem):
@@ -68,6 +76,13 @@ def better_play_multiple_ghosts(problem):
 
 
 if __name__ == "__main__":
+    profile = pop_flag(sys.argv, '--profile')
+    SmartGameWithMultiGhost.maze_ghost_distance = pop_flag(sys.argv, '--maze-distance')
+    # the games with maze distances are another engine for the outcome cache
+    engine = SmartGameWithMultiGhost.__name__ + ('-maze' if SmartGameWithMultiGhost.maze_ghost_distance else '')
+    cache = OutcomeCache() if pop_flag(sys.argv, '--cache') else None
+    # with a seed start, the i-th trial plays its own reproducible game with seed start + i
+    seed_start = pop_option(sys.argv, '--seed-start')
     test_case_id = int(sys.argv[1])
     problem_id = 4
     file_name_problem = str(test_case_id) + '.prob'
@@ -79,10 +94,20 @@ if __name__ == "__main__":
     print('test_case_id:', test_case_id)
     print('num_trials:', num_trials)
     print('verbose:', verbose)
+    profiler = Profiler(os.path.join('profiles', f'p{problem_id}_{test_case_id}'), enabled=profile)
     start = time.time()
     win_count = 0
     for i in range(num_trials):
-        solution, winner = better_play_multiple_ghosts(copy.deepcopy(problem))
+        if seed_start is not None:
+            problem['seed'] = seed_start + i
+        # the memory report plays the game again, without the cache
+        with profiler.game(i + 1, memory_run=lambda: better_play_multiple_ghosts(copy.deepcopy(problem))):
+            if cache:
+                solution, winner = cache.play(
+                    problem, engine, lambda: better_play_multiple_ghosts(copy.deepcopy(problem)),
+                    weights=SmartGameWithMultiGhost.weights)
+            else:
+                solution, winner = better_play_multiple_ghosts(copy.deepcopy(problem))
         if winner == 'Pacman':
             win_count += 1
         if verbose:
@@ -91,3 +116,7 @@ if __name__ == "__main__":
     end = time.time()
     print('time: ', end - start)
     print('win %', win_p)
+    if cache:
+        print('cache hits:', cache.hits)
+        cache.close()
+    profiler.save()
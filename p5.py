@@ -1,22 +1,38 @@
-import sys, parse
+import sys, parse, logging
+from profiler import Profiler
+from parse import pop_flag, pop_option
+from pn_solver import prove_pacman_win
+from search_engine import IterativeSearch
+from distance_field import MazeDistances
 import time, os, copy
 from p1 import PACMAN
 from p2 import calculate_manhattan_distance
 from p3 import MultiGhostBoard, MultiGhostGame
 from collections import deque
 
+logger = logging.getLogger(__name__)
+
 
 class MinimaxGame(MultiGhostGame):
     """
     Based on p3, we implement a minimax pacman against multiple minimax ghosts
     """
+    # weights of the evaluation functions, tuner.py can override them per game
+    weights = {'manhattan_ghost': 2, 'bfs_food': 1, 'bfs_ghost': 2}
 
-    def __init__(self, board, depth):
+    def __init__(self, board, depth, node_budget=None, max_depth=100, maze=None):
         super().__init__(board)
         # k means the depth of the minimax search
         self.depth = depth
+        # with a node budget, the depth of every search is chosen by search_depth, up to max_depth plies
+        self.node_budget = node_budget
+        self.max_depth = max_depth
+        # (step, depth) of every search with a node budget
+        self.depth_log = []
         # count the number of walls, which decide the evaluation method
         self.wall_count = self.count_wall()
+        # the distance to the closest ghost is looked up instead of a bfs, by default in the cached fields of the maze
+        self.maze = maze if maze is not None else MazeDistances.for_grid(board.board)
         # the standard to switch the evaluation method
         self.switch_count = 100
         # record the visited positions of the pacman
@@ -39,9 +55,37 @@ class MinimaxGame(MultiGhostGame):
         solution += f'WIN: {self.winner}'
         return solution, self.winner
 
+    def search_depth(self):
+        """
+        the fixed depth k, or with a node budget, the deepest search whose estimated size fits the budget
+        the size is estimated from the current number of moves of every agent, the agents move in turn from
+        the player to move, and a stuck ghost counts as one move as it passes
+        """
+        if self.node_budget is None:
+            return self.depth
+        agents = [PACMAN] + self.board.ghost_list
+        start = agents.index(self.player)
+        branching = []
+        for i in range(len(agents)):
+            agent = agents[(start + i) % len(agents)]
+            pos = self.board.pacman_pos if agent == PACMAN else self.board.ghost_pos_dict[agent]
+            branching.append(max(1, len(self.board.get_valid_directions_in_order(pos))))
+        depth, nodes, width = 0, 1, 1
+        while depth < self.max_depth:
+            width *= branching[depth % len(branching)]
+            if nodes + width > self.node_budget:
+                break
+            nodes += width
+            depth += 1
+        # always look at least one ply ahead
+        depth = max(depth, 1)
+        self.depth_log.append((self.steps_count, depth))
+        logger.info('step %d: search depth %d, estimated %d nodes', self.steps_count, depth, nodes)
+        return depth
+
     def minimax(self):
         simulation_board = copy.deepcopy(self.board)
-        initial_state = self.get_state(simulation_board, self.depth, self.player)
+        initial_state = self.get_state(simulation_board, self.search_depth(), self.player)
         if self.player == PACMAN:
             self.minimax_pacman(initial_state, float('-inf'), float('inf'))
         else:
@@ -158,9 +202,9 @@ class MinimaxGame(MultiGhostGame):
         evaluate the end state by bfs
         """
         closest_food_distance = self.calculate_bfs(board, board.pacman_pos, board.food_pos_list)
-        closest_ghost_distance = self.calculate_bfs(board, board.pacman_pos, board.ghost_pos_dict.values())
+        closest_ghost_distance = self.maze.closest_distance(board.pacman_pos, board.ghost_pos_dict.values())
         # avoiding pacman moving in a loop, so we give a higher weight to the food here
-        return -closest_food_distance + 2 * closest_ghost_distance
+        return -self.weights['bfs_food'] * closest_food_distance + self.weights['bfs_ghost'] * closest_ghost_distance
 
     def calculate_bfs(self, board, pos, target_pos_list):
         """
@@ -188,7 +232,7 @@ class MinimaxGame(MultiGhostGame):
         closest_to_ghost = self.get_closest_distance(board.pacman_pos, board.ghost_pos_dict.values())
         closest_to_food = self.get_closest_distance(board.pacman_pos, board.food_pos_list)
 
-        return -closest_to_food + 2 * closest_to_ghost
+        return -closest_to_food + self.weights['manhattan_ghost'] * closest_to_ghost
 
     def get_closest_distance(self, pos, target_pos_list):
         closest_distance = float('inf')
@@ -225,13 +269,24 @@ class MinimaxGame(MultiGhostGame):
         return wall_count
 
 
-def min_max_multiple_ghosts(problem, k):
+class IterativeMinimaxGame(IterativeSearch, MinimaxGame):
+    """
+    MinimaxGame with the explicit-stack search of search_engine, for depths beyond the recursion limit
+    """
+    pass
+
+
+def min_max_multiple_ghosts(problem, k, game_class=MinimaxGame, node_budget=None):
     board = MultiGhostBoard(problem['board'])
-    game = MinimaxGame(board, k)
+    game = game_class(board, k, node_budget)
     return game.play_game_with_minimax(problem['seed'])
 
 
 if __name__ == "__main__":
+    profile = pop_flag(sys.argv, '--profile')
+    node_budget = pop_option(sys.argv, '--node-budget')
+    prove = pop_flag(sys.argv, '--prove')
+    game_class = IterativeMinimaxGame if pop_flag(sys.argv, '--iterative') else MinimaxGame
     test_case_id = int(sys.argv[1])
     problem_id = 5
     file_name_problem = str(test_case_id) + '.prob'
@@ -245,10 +300,25 @@ if __name__ == "__main__":
     print('k:', k)
     print('num_trials:', num_trials)
     print('verbose:', verbose)
+    if verbose:
+        # show the depth chosen for every move with --node-budget
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+    if prove:
+        # the proof doesn't depend on the seed, so there is only one run
+        result = prove_pacman_win(copy.deepcopy(problem), k)
+        print('proven:', result['proven'])
+        if verbose:
+            print('line:', ' '.join(f'{player}{direction or "-"}' for player, direction in result['line']))
+        print('stats:', result['stats'])
+        sys.exit()
+    profiler = Profiler(os.path.join('profiles', f'p{problem_id}_{test_case_id}'), enabled=profile)
     start = time.time()
     win_count = 0
     for i in range(num_trials):
-        solution, winner = min_max_multiple_ghosts(copy.deepcopy(problem), k)
+        # the memory report plays the game again
+        with profiler.game(i + 1, memory_run=lambda: min_max_multiple_ghosts(
+                copy.deepcopy(problem), k, game_class, node_budget)):
+            solution, winner = min_max_multiple_ghosts(copy.deepcopy(problem), k, game_class, node_budget)
         if winner == 'Pacman':
             win_count += 1
         if verbose:
@@ -257,3 +327,4 @@ if __name__ == "__main__":
     end = time.time()
     print('time: ', end - start)
     print('win %', win_p)
+    profiler.save()
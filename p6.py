@@ -1,8 +1,12 @@
-import sys, parse
+import sys, parse, logging
+from profiler import Profiler
+from parse import pop_flag, pop_option
+from outcome_cache import OutcomeCache
 import time, os, copy
 from p1 import PACMAN
 from p3 import MultiGhostBoard
 from p5 import MinimaxGame
+from search_engine import IterativeSearch
 import random
 
 
@@ -10,6 +14,7 @@ class ExpectiMaxGame(MinimaxGame):
     """
     Based on MinimaxGame, we implement an expecti-max pacman against multiple random ghosts
     """
+    weights = {'manhattan_ghost': 2, 'bfs_food': 3, 'bfs_ghost': 1, 'eat_food': 100, 'revisit': 100}
 
     def play_game_with_expectimax(self, seed):
         if seed != -1:
@@ -44,7 +49,7 @@ class ExpectiMaxGame(MinimaxGame):
         get best move through expecti-max
         """
         simulation_board = copy.deepcopy(self.board)
-        initial_state = self.get_state(simulation_board, self.depth, self.player)
+        initial_state = self.get_state(simulation_board, self.search_depth(), self.player)
         self.expecti_pacman(initial_state)
         # print('best_move:',  initial_state['best_move'])
         return initial_state['best_move']
@@ -117,11 +122,11 @@ class ExpectiMaxGame(MinimaxGame):
             return -10000
 
         # Give a bonus if pacman eats food, encourage pacman to eat food
-        value = (len(self.board.food_pos_list) - len(board.food_pos_list)) * 100
+        value = (len(self.board.food_pos_list) - len(board.food_pos_list)) * self.weights['eat_food']
 
         # Give a penalty if pacman visits the same position
         if board.pacman_pos in self.visited_positions:
-            value -= 100 * self.visited_positions.count(board.pacman_pos)
+            value -= self.weights['revisit'] * self.visited_positions.count(board.pacman_pos)
 
         value += self.evaluate_manhattan(board) if self.wall_count < self.switch_count else self.evaluate_bfs(board)
         return value
@@ -132,18 +137,31 @@ class ExpectiMaxGame(MinimaxGame):
         It seems that in large and complex boards, give eating food a higher weight will avoid pacman moving in a loop
         """
         closest_food_distance = self.calculate_bfs(board, board.pacman_pos, board.food_pos_list)
-        closest_ghost_distance = self.calculate_bfs(board, board.pacman_pos, board.ghost_pos_dict.values())
+        closest_ghost_distance = self.maze.closest_distance(board.pacman_pos, board.ghost_pos_dict.values())
         # avoiding pacman moving in a loop, so we give a higher weight to the food here
-        return -3 * closest_food_distance + closest_ghost_distance
+        return -self.weights['bfs_food'] * closest_food_distance + self.weights['bfs_ghost'] * closest_ghost_distance
 
 
-def expecti_max_multiple_ghosts(problem, k):
+class IterativeExpectiMaxGame(IterativeSearch, ExpectiMaxGame):
+    """
+    ExpectiMaxGame with the explicit-stack search of search_engine, for depths beyond the recursion limit
+    """
+    pass
+
+
+def expecti_max_multiple_ghosts(problem, k, game_class=ExpectiMaxGame, node_budget=None):
     board = MultiGhostBoard(problem['board'])
-    game = ExpectiMaxGame(board, k)
+    game = game_class(board, k, node_budget)
     return game.play_game_with_expectimax(problem['seed'])
 
 
 if __name__ == "__main__":
+    profile = pop_flag(sys.argv, '--profile')
+    node_budget = pop_option(sys.argv, '--node-budget')
+    cache = OutcomeCache() if pop_flag(sys.argv, '--cache') else None
+    # with a seed start, the i-th trial plays its own reproducible game with seed start + i
+    seed_start = pop_option(sys.argv, '--seed-start')
+    game_class = IterativeExpectiMaxGame if pop_flag(sys.argv, '--iterative') else ExpectiMaxGame
     test_case_id = int(sys.argv[1])
     problem_id = 6
     file_name_problem = str(test_case_id) + '.prob'
@@ -157,10 +175,25 @@ if __name__ == "__main__":
     print('k:', k)
     print('num_trials:', num_trials)
     print('verbose:', verbose)
+    if verbose:
+        # show the depth chosen for every move with --node-budget
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+    profiler = Profiler(os.path.join('profiles', f'p{problem_id}_{test_case_id}'), enabled=profile)
     start = time.time()
     win_count = 0
     for i in range(num_trials):
-        solution, winner = expecti_max_multiple_ghosts(copy.deepcopy(problem), k)
+        if seed_start is not None:
+            problem['seed'] = seed_start + i
+        # the memory report plays the game again, without the cache
+        with profiler.game(i + 1, memory_run=lambda: expecti_max_multiple_ghosts(
+                copy.deepcopy(problem), k, game_class, node_budget)):
+            if cache:
+                solution, winner = cache.play(
+                    problem, game_class.__name__ + (f'-budget{node_budget}' if node_budget else ''),
+                    lambda: expecti_max_multiple_ghosts(copy.deepcopy(problem), k, game_class, node_budget),
+                    depth=k, weights=game_class.weights)
+            else:
+                solution, winner = expecti_max_multiple_ghosts(copy.deepcopy(problem), k, game_class, node_budget)
         if winner == 'Pacman':
             win_count += 1
         if verbose:
@@ -169,3 +202,7 @@ if __name__ == "__main__":
     end = time.time()
     print('time: ', end - start)
     print('win %', win_p)
+    if cache:
+        print('cache hits:', cache.hits)
+        cache.close()
+    profiler.save()
@@ -11,6 +11,27 @@ def read_layout_problem(file_path):
     return problem
 
 
+def pop_flag(argv, flag):
+    """
+    remove an optional flag from the command line arguments and return whether it was given
+    """
+    if flag in argv:
+        argv.remove(flag)
+        return True
+    return False
+
+
+def pop_option(argv, name, default=None):
+    """
+    remove an optional name=value argument from the command line arguments and return its integer value
+    """
+    for arg in argv:
+        if arg.startswith(name + '='):
+            argv.remove(arg)
+            return int(arg.split('=', 1)[1])
+    return default
+
+
 if __name__ == "__main__":
     if len(sys.argv) == 3:
         problem_id, test_case_id = sys.argv[1], sys.argv[2]
@@ -0,0 +1,194 @@
+import time
+from p1 import DIRECTIONS, PACMAN, WALL
+from p3 import MultiGhostBoard
+
+# proof and disproof numbers are capped at INFINITY
+INFINITY = 10 ** 9
+# the same order as get_valid_directions_in_order
+ORDERED_DIRECTIONS = sorted(DIRECTIONS.keys())
+
+
+class Node:
+    """
+    A node of the proof-number search tree, pacman nodes are OR nodes and ghost nodes are AND nodes
+    state: (pacman position, ghost positions in the ghost order, frozenset of food, index of the player to move)
+    """
+    __slots__ = ('state', 'depth', 'parent', 'move', 'children', 'proof', 'disproof')
+
+    def __init__(self, state, depth, parent, move):
+        self.state = state
+        self.depth = depth
+        self.parent = parent
+        self.move = move
+        self.children = None
+        self.proof = 1
+        self.disproof = 1
+
+
+class ProofNumberSolver:
+    """
+    Prove or disprove that pacman forces a win within depth plies against minimax ghosts, like p5 asks.
+    A ply is the move of one agent as in MinimaxGame, and a stuck ghost passes its ply.
+    Solved nodes are stored in a transposition table keyed by state and remaining depth,
+    and their subtrees are released, the winning line is rebuilt from the table.
+    """
+    def __init__(self, board, depth, max_nodes=10 ** 7):
+        self.walls = {(row, col) for row in range(len(board.board)) for col in range(len(board.board[0]))
+                      if board.board[row][col] == WALL}
+        self.ghost_list = list(board.ghost_list)
+        self.depth = depth
+        self.max_nodes = max_nodes
+        self.root_state = (board.pacman_pos, tuple(board.ghost_pos_dict[ghost] for ghost in self.ghost_list),
+                           frozenset(board.food_pos_list), 0)
+        # (state, depth) -> (proven, move), move is the winning move of a proven pacman node
+        self.table = {}
+        self.stats = {'created': 0, 'expanded': 0, 'table_hits': 0}
+
+    def solve(self):
+        """
+        return the proof result: proven (pacman forces a win), the winning line as (player, direction) pairs
+        and the statistics, proven is None if the node budget runs out first
+        """
+        start = time.time()
+        root = self.create_node(self.root_state, self.depth, None, None)
+        while root.proof and root.disproof and self.stats['created'] < self.max_nodes:
+            node = self.select_most_proving(root)
+            self.expand(node)
+            self.update_ancestors(node)
+        self.stats['time'] = time.time() - start
+        self.stats['table_size'] = len(self.table)
+        if root.proof == 0:
+            proven = True
+        elif root.disproof == 0:
+            proven = False
+        else:
+            proven = None
+        return {'proven': proven, 'line': self.winning_line() if proven else [], 'stats': self.stats}
+
+    def create_node(self, state, depth, parent, move):
+        self.stats['created'] += 1
+        node = Node(state, depth, parent, move)
+        key = (state, depth)
+        if key in self.table:
+            self.stats['table_hits'] += 1
+            self.set_solved(node, self.table[key][0])
+            return node
+        result = self.game_over(state)
+        if result is None and depth == 0:
+            result = False
+        if result is not None:
+            self.set_solved(node, result)
+            self.table[key] = (result, None)
+        return node
+
+    def set_solved(self, node, proven):
+        node.proof, node.disproof = (0, INFINITY) if proven else (INFINITY, 0)
+
+    def game_over(self, state):
+        """
+        True if pacman wins, False if ghosts win, None if the game goes on
+        """
+        pacman_pos, ghost_positions, food, _ = state
+        if pacman_pos in ghost_positions:
+            return False
+        if not food:
+            return True
+        return None
+
+    def select_most_proving(self, node):
+        while node.children:
+            if node.state[3] == 0:
+                node = min(node.children, key=lambda child: child.proof)
+            else:
+                node = min(node.children, key=lambda child: child.disproof)
+        return node
+
+    def expand(self, node):
+        self.stats['expanded'] += 1
+        node.children = [self.create_node(state, node.depth - 1, node, move)
+                         for move, state in self.successors(node.state)]
+        # a pacman boxed in by walls can't win
+        if not node.children:
+            self.set_solved(node, False)
+            node.children = None
+
+    def successors(self, state):
+        """
+        the moves of the player to move in the order of get_valid_directions_in_order, with the next states
+        """
+        pacman_pos, ghost_positions, food, player = state
+        next_player = (player + 1) % (len(ghost_positions) + 1)
+        if player == 0:
+            for direction in ORDERED_DIRECTIONS:
+                new_pos = self.move_by_direction(pacman_pos, direction)
+                if new_pos not in self.walls:
+                    yield direction, (new_pos, ghost_positions, food - {new_pos}, next_player)
+        else:
+            ghost_pos = ghost_positions[player - 1]
+            moved = False
+            for direction in ORDERED_DIRECTIONS:
+                new_pos = self.move_by_direction(ghost_pos, direction)
+                # ghosts can't move on top of each other
+                if new_pos not in self.walls and new_pos not in ghost_positions:
+                    moved = True
+                    new_ghost_positions = ghost_positions[:player - 1] + (new_pos,) + ghost_positions[player:]
+                    yield direction, (pacman_pos, new_ghost_positions, food, next_player)
+            if not moved:
+                yield '', (pacman_pos, ghost_positions, food, next_player)
+
+    def move_by_direction(self, pos, direction):
+        d_row, d_col = DIRECTIONS[direction]
+        return pos[0] + d_row, pos[1] + d_col
+
+    def set_numbers(self, node):
+        if node.state[3] == 0:
+            node.proof = min(child.proof for child in node.children)
+            node.disproof = min(INFINITY, sum(child.disproof for child in node.children))
+        else:
+            node.proof = min(INFINITY, sum(child.proof for child in node.children))
+            node.disproof = min(child.disproof for child in node.children)
+
+    def update_ancestors(self, node):
+        while node is not None:
+            proof, disproof = node.proof, node.disproof
+            if node.children is not None:
+                self.set_numbers(node)
+            if node.proof == 0 or node.disproof == 0:
+                self.record_solved(node)
+            elif (proof, disproof) == (node.proof, node.disproof) and node.children is not None:
+                # nothing changes above this node
+                break
+            node = node.parent
+
+    def record_solved(self, node):
+        key = (node.state, node.depth)
+        if key not in self.table:
+            move = None
+            if node.proof == 0 and node.state[3] == 0 and node.children:
+                move = next(child.move for child in node.children if child.proof == 0)
+            self.table[key] = (node.proof == 0, move)
+        # the subtree of a solved node is no longer needed
+        node.children = []
+
+    def winning_line(self):
+        """
+        follow the winning moves of pacman and the first move of the ghosts from the root to the win
+        """
+        line = []
+        state, depth = self.root_state, self.depth
+        while self.game_over(state) is None:
+            player = state[3]
+            if player == 0:
+                _, move = self.table[(state, depth)]
+                state = next(child for direction, child in self.successors(state) if direction == move)
+            else:
+                # every move of a ghost loses, follow the first one
+                move, state = next(self.successors(state))
+            line.append((PACMAN if player == 0 else self.ghost_list[player - 1], move))
+            depth -= 1
+        return line
+
+
+def prove_pacman_win(problem, k):
+    board = MultiGhostBoard(problem['board'])
+    return ProofNumberSolver(board, k).solve()
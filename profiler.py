@@ -0,0 +1,168 @@
+import os, sys, time, threading
+import cProfile, pstats, tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from p1 import Game
+
+# tracemalloc traces every thread, the snapshots leave out the allocations of the profiler and its sampler
+SNAPSHOT_FILTERS = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+
+
+class Profiler:
+    """
+    Profiling mode for the trial loops of p2/p4/p5/p6, enabled by --profile.
+    For every game we record a cProfile dump, and every pacman move inside a game is a separate scope:
+    the collapsed stacks are prefixed with game-N;move-M and tracemalloc records the peak and top allocators per move
+    in a separate run of the game. A move scope covers the pacman decision (the search) and everything since the
+    previous pacman move.
+    """
+    def __init__(self, output_dir, enabled=True, sample_interval=0.001, top_allocators=10):
+        self.output_dir = output_dir
+        self.enabled = enabled
+        self.sample_interval = sample_interval
+        self.top_allocators = top_allocators
+        # 'game-N;move-M' is the prefix of the sampled stacks
+        self.scope = None
+        self.game_id = None
+        self.move_id = 0
+        self.stacks = Counter()
+        self.memory_lines = []
+        self.last_snapshot = None
+        self.sampling = False
+        self.dumps = []
+        self.profile = None
+
+    @contextmanager
+    def game(self, game_id, memory_run=None):
+        """
+        profile a single game, use it around one trial in the __main__ loop
+        tracemalloc slows every allocation down, so it doesn't run with cProfile and the sampler:
+        the memory report comes from a second run of the game by memory_run, if given
+        """
+        if not self.enabled:
+            yield
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        original_handle_pacman = Game.handle_pacman
+        profiler = self
+
+        def handle_pacman(game, direction):
+            # a pacman move closes the current move scope
+            result = original_handle_pacman(game, direction)
+            profiler.next_move()
+            return result
+
+        Game.handle_pacman = handle_pacman
+        try:
+            self.start_game(game_id)
+            sampler = self.start_sampler(threading.get_ident())
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+            try:
+                yield
+            finally:
+                self.profile.disable()
+                self.sampling = False
+                sampler.join()
+                dump = os.path.join(self.output_dir, f'game-{game_id}.prof')
+                self.profile.dump_stats(dump)
+                self.dumps.append(dump)
+                self.profile = None
+            if memory_run is not None:
+                self.start_game(game_id)
+                self.start_tracing()
+                self.last_snapshot = self.take_snapshot()
+                try:
+                    memory_run()
+                finally:
+                    self.record_memory()
+                    tracemalloc.stop()
+        finally:
+            Game.handle_pacman = original_handle_pacman
+
+    def start_game(self, game_id):
+        self.game_id = game_id
+        self.move_id = 0
+        self.next_move()
+
+    def next_move(self):
+        if self.move_id > 0:
+            # keep the bookkeeping of the profiler out of the cProfile stats and the sampled stacks
+            if self.profile is not None:
+                self.profile.disable()
+            self.scope = None
+            self.record_memory()
+            if self.profile is not None:
+                self.profile.enable()
+        self.move_id += 1
+        self.scope = f'game-{self.game_id};move-{self.move_id}'
+
+    def record_memory(self):
+        """
+        record the peak memory of the current move and the lines which allocated the most since the last move
+        """
+        if not tracemalloc.is_tracing():
+            return
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = self.take_snapshot()
+        self.memory_lines.append(f'game-{self.game_id};move-{self.move_id}: current {current} B, peak {peak} B')
+        for stat in snapshot.compare_to(self.last_snapshot, 'lineno')[:self.top_allocators]:
+            if stat.size_diff > 0:
+                self.memory_lines.append(f'    {stat}')
+        self.last_snapshot = snapshot
+        tracemalloc.reset_peak()
+
+    def start_tracing(self):
+        """
+        the first filtering of a snapshot with traces compiles the file name patterns with re and fills the caches
+        of abc, and the filters only look at the innermost frame, so re and abc would show up as allocators of the
+        first move: fill these caches in a throwaway round of tracing
+        """
+        tracemalloc.start()
+        self.take_snapshot()
+        self.take_snapshot()
+        tracemalloc.stop()
+        tracemalloc.start()
+
+    def take_snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+    def start_sampler(self, thread_id):
+        """
+        sample the stack of the profiled thread in the background to build the collapsed stacks
+        """
+        self.sampling = True
+
+        def sample():
+            while self.sampling:
+                scope = self.scope
+                frame = sys._current_frames().get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                if stack and scope:
+                    self.stacks[';'.join([scope] + stack[::-1])] += 1
+                time.sleep(self.sample_interval)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        return sampler
+
+    def save(self):
+        """
+        write the merged cProfile stats, the collapsed stacks and the memory report into the output directory
+        """
+        if not self.enabled or not self.dumps:
+            return
+        with open(os.path.join(self.output_dir, 'stacks.collapsed'), 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f'{stack} {count}\n')
+        with open(os.path.join(self.output_dir, 'memory.txt'), 'w') as f:
+            f.write('\n'.join(self.memory_lines) + '\n')
+        with open(os.path.join(self.output_dir, 'cprofile.txt'), 'w') as f:
+            stats = pstats.Stats(*self.dumps, stream=f)
+            stats.sort_stats('cumulative').print_stats(30)
+        print('profile:', self.output_dir)
+
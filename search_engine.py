@@ -0,0 +1,173 @@
+import copy
+from p1 import PACMAN
+
+
+class SearchFrame:
+    """
+    The preallocated state of one ply of the iterative search
+    """
+    __slots__ = ('state', 'directions', 'index', 'value', 'alpha', 'beta', 'undo')
+
+    def __init__(self, state):
+        self.state = state
+        self.directions = None
+        self.index = 0
+        self.value = 0
+        self.alpha = float('-inf')
+        self.beta = float('inf')
+        # (positions and cells before the current move, index of the eaten food or None)
+        self.undo = None
+
+    def enter(self, state, alpha, beta):
+        """
+        start the search of a node, every frame gets the bounds of its parent, the root gets the full window
+        """
+        self.state = state
+        self.alpha = alpha
+        self.beta = beta
+
+
+class IterativeSearch:
+    """
+    Mixin for MinimaxGame and ExpectiMaxGame, replace the recursive searches by a loop over an explicit stack.
+    There is one simulation board for the whole search, every move is applied in place and undone when the
+    child returns, and every ply has a preallocated frame, so the depth is not bounded by the recursion limit.
+    The visiting order, the pruning and the tie-breaking are the same as in the recursive versions,
+    so they return the same values and best moves.
+    """
+    search_frames = None
+
+    def minimax(self):
+        simulation_board = copy.deepcopy(self.board)
+        initial_state = self.get_state(simulation_board, self.search_depth(), self.player)
+        self.iterative_search(initial_state, expecti=False)
+        return initial_state['best_move']
+
+    def expecti_max(self):
+        simulation_board = copy.deepcopy(self.board)
+        initial_state = self.get_state(simulation_board, self.search_depth(), self.player)
+        self.iterative_search(initial_state, expecti=True)
+        return initial_state['best_move']
+
+    def get_search_frames(self, board, depth):
+        """
+        the frames are kept between the searches of a game, and only grow if the depth grows
+        """
+        if self.search_frames is None or len(self.search_frames) <= depth:
+            self.search_frames = [SearchFrame(self.get_state(board, 0, PACMAN)) for _ in range(depth + 1)]
+        for frame in self.search_frames:
+            frame.state['board'] = board
+        return self.search_frames
+
+    def iterative_search(self, initial_state, expecti):
+        """
+        pacman nodes are max nodes, ghost nodes are min nodes (minimax) or chance nodes (expecti-max)
+        return the value of the initial state and set its best move
+        """
+        board = initial_state['board']
+        frames = self.get_search_frames(board, initial_state['depth'])
+        ply = 0
+        frame = frames[0]
+        frame.enter(initial_state, float('-inf'), float('inf'))
+        entering = True
+        while True:
+            if entering:
+                state = frame.state
+                player = state['player']
+                if self.terminal_state(state):
+                    value = self.evaluate(board)
+                else:
+                    pos = board.pacman_pos if player == PACMAN else board.ghost_pos_dict[player]
+                    frame.directions = board.get_valid_directions_in_order(pos)
+                    frame.index = 0
+                    if player == PACMAN:
+                        frame.value = float('-inf')
+                    else:
+                        frame.value = 0 if expecti else float('inf')
+                    value = None
+            else:
+                # a child returned its value, undo its move and merge the value
+                state = frame.state
+                player = state['player']
+                self.undo_move(board, player, frame.undo)
+                if expecti and player == PACMAN:
+                    self.visited_positions.pop()
+                direction = frame.directions[frame.index]
+                frame.index += 1
+                value = None
+                if player == PACMAN:
+                    if child_value > frame.value:
+                        frame.value = child_value
+                        state['best_move'] = direction
+                    if not expecti:
+                        frame.alpha = max(frame.alpha, frame.value)
+                        if frame.alpha >= frame.beta:
+                            value = frame.value
+                elif expecti:
+                    frame.value += child_value
+                else:
+                    if child_value < frame.value:
+                        frame.value = child_value
+                        state['best_move'] = direction
+                    frame.beta = min(frame.beta, frame.value)
+                    if frame.alpha >= frame.beta:
+                        value = frame.value
+
+            if value is None:
+                if frame.index < len(frame.directions):
+                    # enter the next child
+                    direction = frame.directions[frame.index]
+                    frame.undo = self.apply_move(board, player, direction)
+                    if expecti and player == PACMAN:
+                        self.visited_positions.append(board.pacman_pos)
+                    child = frames[ply + 1]
+                    child_state = child.state
+                    child_state['depth'] = state['depth'] - 1
+                    child_state['player'] = self.get_next_player(player, board.ghost_list)
+                    child_state['best_move'] = None
+                    child.enter(child_state, frame.alpha, frame.beta)
+                    ply += 1
+                    frame = child
+                    entering = True
+                    continue
+                if player != PACMAN and expecti:
+                    value = frame.value / len(frame.directions) if frame.directions else 0
+                else:
+                    value = frame.value
+
+            # return the value to the parent
+            if ply == 0:
+                return value
+            child_value = value
+            ply -= 1
+            frame = frames[ply]
+            entering = False
+
+    def apply_move(self, board, player, direction):
+        """
+        the same move as simulate_move, but on the board itself, return what undo_move needs
+        """
+        pos = board.pacman_pos if player == PACMAN else board.ghost_pos_dict[player]
+        new_pos = board.move_by_direction(pos, direction)
+        cells = (board.board[pos[0]][pos[1]], board.board[new_pos[0]][new_pos[1]])
+        board.update_board(pos, new_pos, player)
+        food_index = None
+        if player == PACMAN:
+            board.pacman_pos = new_pos
+            if new_pos in board.food_pos_list:
+                food_index = board.food_pos_list.index(new_pos)
+                board.food_pos_list.pop(food_index)
+        else:
+            board.ghost_pos_dict[player] = new_pos
+        return pos, new_pos, cells, food_index
+
+    def undo_move(self, board, player, undo):
+        pos, new_pos, cells, food_index = undo
+        board.board[pos[0]][pos[1]], board.board[new_pos[0]][new_pos[1]] = cells
+        board.touch(pos, new_pos)
+        if player == PACMAN:
+            board.pacman_pos = pos
+            if food_index is not None:
+                board.food_pos_list.insert(food_index, new_pos)
+        else:
+            board.ghost_pos_dict[player] = pos
@@ -0,0 +1,261 @@
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from p1 import DIRECTIONS, PACMAN, FOOD, WALL, EMPTY
+from p3 import MultiGhostBoard
+from p5 import MinimaxGame
+from p6 import ExpectiMaxGame
+from distance_field import Distances, MazeDistances
+
+# the same order as get_valid_directions_in_order
+NEIGHBOR_DIRECTIONS = sorted(DIRECTIONS.keys())
+UNREACHABLE = -1
+HEADER = struct.Struct('iii')
+
+# engine name -> (game class, search method)
+SEARCH_ENGINES = {
+    'minimax': (MinimaxGame, 'minimax'),
+    'expectimax': (ExpectiMaxGame, 'expecti_max'),
+}
+
+# layouts attached by this process, shared memory name -> StaticLayout
+_attached_layouts = {}
+# games reused by the tasks of this process, (shared memory name, engine, shared_distances) -> game
+_worker_games = {}
+
+
+class SharedLayoutBoard(MultiGhostBoard):
+    """
+    A MultiGhostBoard of a published layout, the valid moves come from the neighbor table instead of the grid.
+    The copies of the search share the layout.
+    """
+    layout = None
+
+    def __deepcopy__(self, memo):
+        memo[id(self.layout)] = self.layout
+        return super().__deepcopy__(memo)
+
+    def get_valid_directions_in_order(self, pos):
+        """
+        the neighbors are in the order E N S W, the same as the sorted directions
+        """
+        start = 4 * self.layout.index_of(pos)
+        neighbors = self.layout.neighbors
+        # ghosts can't move on top of each other
+        ghost = self.board[pos[0]][pos[1]] in self.ghost_list
+        valid_directions = []
+        for offset, direction in enumerate(NEIGHBOR_DIRECTIONS):
+            if neighbors[start + offset] == UNREACHABLE:
+                continue
+            if ghost:
+                d_row, d_col = DIRECTIONS[direction]
+                if self.board[pos[0] + d_row][pos[1] + d_col] in self.ghost_list:
+                    continue
+            valid_directions.append(direction)
+        return valid_directions
+
+
+class StaticLayout(Distances):
+    """
+    The immutable part of a layout: walls, open cell index, neighbor table and the maze distances between open cells.
+    The arrays live in one shared memory block, so worker processes attach them without copying.
+
+    Memory layout of the block: header (height, width, open cell count), walls (1 byte per cell),
+    cell index (int per cell, -1 for walls), open cells (int per open cell), neighbors (4 ints per open cell
+    in the order E N S W, -1 for walls) and distances (short per pair of open cells, -1 if unreachable).
+    """
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.height, self.width, self.open_count = HEADER.unpack_from(shm.buf, 0)
+        offsets = self.offsets(self.height, self.width, self.open_count)
+        cells = self.height * self.width
+        self.walls = shm.buf[offsets['walls']:offsets['walls'] + cells]
+        self.cell_index = shm.buf[offsets['cell_index']:offsets['open_cells']].cast('i')
+        self.open_cells = shm.buf[offsets['open_cells']:offsets['neighbors']].cast('i')
+        self.neighbors = shm.buf[offsets['neighbors']:offsets['distances']].cast('i')
+        self.distances = shm.buf[offsets['distances']:offsets['size']].cast('h')
+        # the empty grid of the walls, copied by decode_board
+        self.wall_grid = [[WALL if self.walls[row * self.width + col] else EMPTY for col in range(self.width)]
+                          for row in range(self.height)]
+
+    @staticmethod
+    def offsets(height, width, open_count):
+        cells = height * width
+        offsets = {'walls': HEADER.size}
+        # keep the int arrays aligned
+        offsets['cell_index'] = offsets['walls'] + cells + (-cells) % 4
+        offsets['open_cells'] = offsets['cell_index'] + 4 * cells
+        offsets['neighbors'] = offsets['open_cells'] + 4 * open_count
+        offsets['distances'] = offsets['neighbors'] + 16 * open_count
+        offsets['size'] = offsets['distances'] + 2 * open_count ** 2
+        return offsets
+
+    @classmethod
+    def publish(cls, grid):
+        """
+        build the static data of a board (a list of char rows) and publish it in a new shared memory block
+        """
+        height, width = len(grid), len(grid[0])
+        cell_index = [UNREACHABLE] * (height * width)
+        open_cells = []
+        for row in range(height):
+            for col in range(width):
+                if grid[row][col] != WALL:
+                    cell_index[row * width + col] = len(open_cells)
+                    open_cells.append(row * width + col)
+        open_count = len(open_cells)
+
+        neighbors = []
+        for cell in open_cells:
+            row, col = divmod(cell, width)
+            for direction in NEIGHBOR_DIRECTIONS:
+                d_row, d_col = DIRECTIONS[direction]
+                neighbors.append(cell_index[(row + d_row) * width + col + d_col])
+
+        # the open cells of the maze are in the same row-major order
+        maze = MazeDistances.for_grid(grid)
+        distances = []
+        for pos in maze.cells:
+            distances.extend(UNREACHABLE if distance == float('inf') else distance for distance in maze.field(pos))
+
+        cells = height * width
+        offsets = cls.offsets(height, width, open_count)
+        shm = shared_memory.SharedMemory(create=True, size=offsets['size'])
+        HEADER.pack_into(shm.buf, 0, height, width, open_count)
+        walls = [1 if index == UNREACHABLE else 0 for index in cell_index]
+        struct.pack_into(f'{cells}B', shm.buf, offsets['walls'], *walls)
+        struct.pack_into(f'{cells}i', shm.buf, offsets['cell_index'], *cell_index)
+        struct.pack_into(f'{open_count}i', shm.buf, offsets['open_cells'], *open_cells)
+        struct.pack_into(f'{4 * open_count}i', shm.buf, offsets['neighbors'], *neighbors)
+        struct.pack_into(f'{open_count ** 2}h', shm.buf, offsets['distances'], *distances)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """
+        attach a published layout by the name of its shared memory block, once per process
+        """
+        if name not in _attached_layouts:
+            # the workers of a pool share the resource tracker of the publisher, which unlinks the block on close
+            _attached_layouts[name] = cls(shared_memory.SharedMemory(name=name), owner=False)
+        return _attached_layouts[name]
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        # the views must be released before the block is closed
+        for view in (self.walls, self.cell_index, self.open_cells, self.neighbors, self.distances):
+            view.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def index_of(self, pos):
+        return self.cell_index[pos[0] * self.width + pos[1]]
+
+    def pos_of(self, index):
+        return divmod(self.open_cells[index], self.width)
+
+    def distance(self, pos1, pos2):
+        """
+        maze distance between two positions, ignoring pacman and ghosts
+        """
+        distance = self.distances[self.index_of(pos1) * self.open_count + self.index_of(pos2)]
+        return float('inf') if distance == UNREACHABLE else distance
+
+    def encode_state(self, board, player):
+        """
+        the dynamic part of a board: pacman, ghosts, a bit mask of the food over the open cells and the player to move
+        """
+        food_mask = 0
+        for food_pos in board.food_pos_list:
+            food_mask |= 1 << self.index_of(food_pos)
+        ghosts = tuple((ghost, self.index_of(pos)) for ghost, pos in board.ghost_pos_dict.items())
+        return self.index_of(board.pacman_pos), ghosts, food_mask, player
+
+    def decode_board(self, state):
+        """
+        rebuild a board from the walls and a dynamic state, its moves are looked up in the neighbor table
+        """
+        pacman_index, ghosts, food_mask, _ = state
+        grid = [row[:] for row in self.wall_grid]
+        food_pos_list = []
+        for index in range(self.open_count):
+            if food_mask >> index & 1:
+                row, col = self.pos_of(index)
+                grid[row][col] = FOOD
+                food_pos_list.append((row, col))
+        pacman_pos = self.pos_of(pacman_index)
+        grid[pacman_pos[0]][pacman_pos[1]] = PACMAN
+        # ghosts are drawn on top of the food and the pacman
+        for ghost, index in ghosts:
+            row, col = self.pos_of(index)
+            grid[row][col] = ghost
+        board = SharedLayoutBoard(grid)
+        board.layout = self
+        board.pacman_pos = pacman_pos
+        # food under a ghost is not visible in the grid
+        board.food_pos_list = food_pos_list
+        return board
+
+
+def search_best_move(name, state, engine, depth, shared_distances=False):
+    """
+    worker task: search the best move of a dynamic state on a published layout
+    the distance to the closest ghost is always looked up in the distance table of the layout
+    with shared_distances, the bfs to the closest food is replaced by a lookup in the table as well,
+    which ignores that ghosts block each other
+    """
+    layout = StaticLayout.attach(name)
+    game_class, search = SEARCH_ENGINES[engine]
+    board = layout.decode_board(state)
+    key = (name, engine, shared_distances)
+    if key not in _worker_games:
+        # the wall count and the distance source are set up once per layout, not once per task
+        game = game_class(board, depth, maze=layout)
+        if shared_distances:
+            game.calculate_bfs = lambda board, pos, target_pos_list: layout.closest_distance(pos, target_pos_list)
+        _worker_games[key] = game
+    game = _worker_games[key]
+    # reuse the game object, only reset the state of the last position
+    game.board = board
+    game.depth = depth
+    game.winner = None
+    game.visited_positions = []
+    game.player = state[3]
+    return getattr(game, search)()
+
+
+class SharedLayoutPool:
+    """
+    A process pool working on a single layout, the static data is published once
+    and tasks only send the dynamic state
+    """
+    def __init__(self, grid, workers=None):
+        self.grid = grid
+        self.workers = workers
+        self.layout = None
+        self.executor = None
+
+    def __enter__(self):
+        self.layout = StaticLayout.publish(self.grid)
+        self.executor = ProcessPoolExecutor(self.workers)
+        return self
+
+    def __exit__(self, *exc_info):
+        self.executor.shutdown()
+        self.layout.close()
+
+    def encode_state(self, board, player=PACMAN):
+        return self.layout.encode_state(board, player)
+
+    def submit(self, state, engine, depth, shared_distances=False):
+        return self.executor.submit(search_best_move, self.layout.name, state, engine, depth, shared_distances)
+
+    def map(self, states, engine, depth, shared_distances=False):
+        futures = [self.submit(state, engine, depth, shared_distances) for state in states]
+        for future in futures:
+            yield future.result()
@@ -0,0 +1,75 @@
+from p1 import DIRECTIONS, WALL
+
+
+class Transform:
+    """
+    A mirror or rotation of the board, maps positions and directions
+    """
+    def __init__(self, name, map_pos):
+        self.name = name
+        self.map_pos = map_pos
+        # the image of a direction is the difference of the images of two neighbor cells
+        origin = map_pos(0, 0)
+        vectors = {vector: direction for direction, vector in DIRECTIONS.items()}
+        self.direction_map = {}
+        for direction, (d_row, d_col) in DIRECTIONS.items():
+            row, col = map_pos(d_row, d_col)
+            self.direction_map[direction] = vectors[(row - origin[0], col - origin[1])]
+        self.inverse_direction_map = {image: direction for direction, image in self.direction_map.items()}
+
+    def map_direction(self, direction):
+        return self.direction_map.get(direction, direction)
+
+    def unmap_direction(self, direction):
+        return self.inverse_direction_map.get(direction, direction)
+
+
+def board_transforms(height, width):
+    """
+    the mirrors and rotations of a height x width board, the quarter turns only fit square boards
+    """
+    transforms = [
+        Transform('identity', lambda row, col: (row, col)),
+        Transform('mirror', lambda row, col: (row, width - 1 - col)),
+        Transform('flip', lambda row, col: (height - 1 - row, col)),
+        Transform('rotate 180', lambda row, col: (height - 1 - row, width - 1 - col)),
+    ]
+    if height == width:
+        transforms += [
+            Transform('transpose', lambda row, col: (col, row)),
+            Transform('anti-transpose', lambda row, col: (width - 1 - col, height - 1 - row)),
+            Transform('rotate 90', lambda row, col: (col, height - 1 - row)),
+            Transform('rotate 270', lambda row, col: (width - 1 - col, row)),
+        ]
+    return transforms
+
+
+class LayoutSymmetry:
+    """
+    The symmetry group of a layout, detected once from the walls.
+    States which are images of each other under the group share one canonical key,
+    the smallest key among the images, so a cache stores them only once.
+    """
+    def __init__(self, walls):
+        height, width = len(walls), len(walls[0])
+        self.transforms = []
+        for transform in board_transforms(height, width):
+            if all((walls[row][col] == WALL) == (walls[image[0]][image[1]] == WALL)
+                   for row in range(height) for col in range(width)
+                   for image in [transform.map_pos(row, col)]):
+                self.transforms.append(transform)
+
+    def canonical(self, pacman_pos, ghost_pos_dict, food_pos_list):
+        """
+        return the canonical key of a state and the transform which maps the state to it,
+        ghosts keep their names, as the ghosts move in alphabetical order
+        """
+        best_key, best_transform = None, None
+        for transform in self.transforms:
+            map_pos = transform.map_pos
+            key = (map_pos(*pacman_pos),
+                   tuple((ghost, map_pos(*pos)) for ghost, pos in ghost_pos_dict.items()),
+                   tuple(sorted(map_pos(*pos) for pos in food_pos_list)))
+            if best_key is None or key < best_key:
+                best_key, best_transform = key, transform
+        return best_key, best_transform
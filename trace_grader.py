@@ -0,0 +1,106 @@
+import os, re
+from itertools import islice
+from outcome_cache import TraceWriter
+
+
+class TraceMismatch(Exception):
+    """
+    raised by the comparator to stop the game at the first frame that differs from the solution
+    """
+    def __init__(self, step, expected, actual):
+        super().__init__(f'step {step} differs')
+        self.step = step
+        self.expected = expected
+        self.actual = actual
+
+
+class TraceComparator:
+    """
+    Compare the frames of a game with a .sol file while the game is played.
+    Every frame is matched against the same number of lines read from the file,
+    so only one frame of the solution is in memory no matter how long the game is.
+    """
+    def __init__(self, sol_file):
+        self.sol_file = sol_file
+        # step 0 is the initial board
+        self.step = 0
+
+    def __call__(self, frame):
+        expected = ''.join(islice(self.sol_file, frame.count('\n')))
+        if expected != frame:
+            raise TraceMismatch(self.step, expected, frame)
+        self.step += 1
+
+    def finish(self, tail):
+        """
+        compare the rest of the solution returned by the game (the WIN line) with the rest of the file
+        """
+        expected = self.sol_file.read(len(tail) + 1)
+        if expected != tail:
+            raise TraceMismatch(self.step, expected, tail)
+
+
+def split_frames(trace):
+    """
+    split a whole solution into its frames and the WIN line, a frame starts with a 'N: ' line
+    """
+    lines = trace.splitlines(keepends=True)
+    tail = lines.pop()
+    frames = []
+    for line in lines:
+        if not frames or re.match(r'\d+: ', line):
+            frames.append('')
+        frames[-1] += line
+    return frames, tail
+
+
+def grade(problem_id, test_case_id, student_code_problem, student_code_parse, cache=None):
+    """
+    the same as grader.grade, but the games are compared frame by frame and stopped at the first mismatch
+    student_code_problem has to accept a trace_sink keyword
+    with an OutcomeCache, the traces of seeded games are replayed from the cache instead of simulated
+    """
+    print('Grading Problem', problem_id, ':')
+    if test_case_id > 0:
+        check_test_case(problem_id, test_case_id, student_code_problem, student_code_parse, cache)
+    else:
+        for i in range(1, -test_case_id + 1):
+            check_test_case(problem_id, i, student_code_problem, student_code_parse, cache)
+
+
+def check_test_case(problem_id, test_case_id, student_code_problem, student_code_parse, cache=None):
+    path = os.path.join('test_cases', 'p' + str(problem_id))
+    problem = student_code_parse(os.path.join(path, str(test_case_id) + '.prob'))
+    key = cache.key(problem, student_code_problem.__name__) if cache else None
+    outcome = cache.get(key) if key else None
+    with open(os.path.join(path, str(test_case_id) + '.sol')) as file_sol:
+        comparator = TraceComparator(file_sol)
+        try:
+            if outcome and outcome['trace'] is not None:
+                frames, tail = split_frames(outcome['trace'])
+                for frame in frames:
+                    comparator(frame)
+            else:
+                # the frames of a cached game are compressed as they come, not kept
+                writer = TraceWriter() if key else None
+
+                def sink(frame):
+                    comparator(frame)
+                    if writer:
+                        writer.write(frame)
+
+                tail = student_code_problem(problem, trace_sink=sink)
+                if writer:
+                    writer.write(tail)
+                    cache.put(key, *writer.summary(), compressed_trace=writer.finish())
+            comparator.finish(tail)
+        except TraceMismatch as mismatch:
+            print('---------->', 'Test case', test_case_id, 'FAILED', '<----------')
+            print('First difference at step', mismatch.step)
+            print('Your frame')
+            print(mismatch.actual)
+            print('Correct frame')
+            print(mismatch.expected)
+            return False
+    print('---------->', 'Test case', test_case_id, 'PASSED', '<----------')
+    return True
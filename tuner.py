@@ -0,0 +1,200 @@
+import sys, os, time, math, itertools
+from concurrent.futures import ProcessPoolExecutor
+import parse
+from p1 import Board
+from p2 import SmartGame
+from p3 import MultiGhostBoard
+from p4 import SmartGameWithMultiGhost
+from p6 import ExpectiMaxGame
+
+# engine name -> (board class, game class, test cases directory)
+ENGINES = {
+    'smart': (Board, SmartGame, 'p2'),
+    'smart_multi_ghost': (MultiGhostBoard, SmartGameWithMultiGhost, 'p4'),
+    'expectimax': (MultiGhostBoard, ExpectiMaxGame, 'p6'),
+}
+
+
+def play_trial(engine, weights, layout_path, seed, depth, max_moves=1000):
+    """
+    play a single game with the given evaluation weights, return whether pacman wins,
+    the time of the game and the number of pacman moves
+    some weights make pacman dodge a random ghost forever, so the game is a draw after max_moves pacman moves
+    """
+    board_class, game_class, _ = ENGINES[engine]
+    problem = parse.read_layout_problem(layout_path)
+    board = board_class(problem['board'])
+    game = game_class(board, depth) if game_class is ExpectiMaxGame else game_class(board)
+    game.weights = weights
+    handle_pacman = game.handle_pacman
+    moves = [0]
+
+    def handle_pacman_with_limit(direction):
+        state = handle_pacman(direction)
+        moves[0] += 1
+        if moves[0] >= max_moves and not game.game_over:
+            game.game_over = True
+        return state
+
+    game.handle_pacman = handle_pacman_with_limit
+    start = time.time()
+    if game_class is ExpectiMaxGame:
+        solution, winner = game.play_game_with_expectimax(seed)
+    else:
+        solution, winner = game.play_game_smart(seed)
+    seconds = time.time() - start
+    return winner == 'Pacman', seconds, moves[0]
+
+
+class Candidate:
+    """
+    A weight vector and its results, the i-th outcome is played on the same layout and seed for every candidate
+    """
+    def __init__(self, weights):
+        self.weights = weights
+        self.outcomes = []
+        self.seconds = 0
+        self.moves = 0
+        self.dropped_at = None
+
+    def win_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0
+
+    def ms_per_move(self):
+        return self.seconds / self.moves * 1000 if self.moves else 0
+
+
+class Tuner:
+    """
+    Run candidate weight vectors in a process pool and drop the losing ones early by SPRT.
+
+    Every candidate plays the same games, so we compare a candidate with the leader on paired games.
+    Only the games where exactly one of them wins are informative, and under H0 the candidate wins such a game
+    with probability 0.5 - delta (it is worse), under H1 with probability 0.5 (it is not worse).
+    A candidate is dropped as soon as the test accepts H0.
+    """
+    def __init__(self, engine, candidates, depth=2, max_games=1000, batch_size=20, workers=None,
+                 delta=0.1, alpha=0.05, beta=0.05):
+        self.engine = engine
+        self.candidates = [Candidate(weights) for weights in candidates]
+        self.depth = depth
+        self.max_games = max_games
+        self.batch_size = batch_size
+        self.workers = workers
+        self.delta = delta
+        self.lower_bound = math.log(beta / (1 - alpha))
+        path = os.path.join('test_cases', ENGINES[engine][2])
+        self.layouts = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith('.prob')]
+
+    def game_setting(self, game_id):
+        """
+        the layout and seed of the game_id-th game, layouts are used in turn
+        """
+        return self.layouts[game_id % len(self.layouts)], game_id + 1
+
+    def tune(self):
+        games = 0
+        with ProcessPoolExecutor(self.workers) as pool:
+            while games < self.max_games:
+                alive = self.alive_candidates()
+                if len(alive) <= 1:
+                    break
+                batch = range(games, min(games + self.batch_size, self.max_games))
+                futures = {}
+                for candidate in alive:
+                    futures[candidate] = [pool.submit(play_trial, self.engine, candidate.weights,
+                                                      *self.game_setting(game_id), self.depth) for game_id in batch]
+                # collect in submission order to keep the results deterministic
+                for candidate in alive:
+                    for future in futures[candidate]:
+                        win, seconds, moves = future.result()
+                        candidate.outcomes.append(win)
+                        candidate.seconds += seconds
+                        candidate.moves += moves
+                games = batch.stop
+                self.drop_losers(games)
+        return self.leader()
+
+    def alive_candidates(self):
+        return [candidate for candidate in self.candidates if candidate.dropped_at is None]
+
+    def leader(self):
+        # the first candidate wins ties, so the result does not depend on the timing
+        return max(self.alive_candidates(), key=lambda candidate: candidate.win_rate())
+
+    def drop_losers(self, games):
+        leader = self.leader()
+        for candidate in self.alive_candidates():
+            if candidate is not leader and self.log_likelihood_ratio(candidate, leader) <= self.lower_bound:
+                candidate.dropped_at = games
+
+    def log_likelihood_ratio(self, candidate, leader):
+        """
+        the log likelihood ratio of H1 (not worse) against H0 (worse by delta)
+        """
+        candidate_wins, leader_wins = 0, 0
+        for candidate_win, leader_win in zip(candidate.outcomes, leader.outcomes):
+            if candidate_win and not leader_win:
+                candidate_wins += 1
+            elif leader_win and not candidate_win:
+                leader_wins += 1
+        return (candidate_wins * math.log(0.5 / (0.5 - self.delta))
+                + leader_wins * math.log(0.5 / (0.5 + self.delta)))
+
+    def report(self):
+        lines = []
+        leader = self.leader()
+        for candidate in sorted(self.candidates, key=lambda candidate: -candidate.win_rate()):
+            if candidate is leader:
+                status = 'leader'
+            elif candidate.dropped_at is None:
+                status = 'alive'
+            else:
+                status = f'dropped after {candidate.dropped_at} games'
+            lines.append(f'{candidate.weights}  games: {len(candidate.outcomes)}  '
+                         f'win %: {candidate.win_rate() * 100:.1f}  ms/move: {candidate.ms_per_move():.2f}  {status}')
+        return '\n'.join(lines)
+
+
+def generate_candidates(default_weights, grid):
+    """
+    build candidates from a grid like {'ghost': [1, 2, 3]}, the other weights keep their default values
+    without a grid, scale every weight by 0.5 and 2 one at a time
+    """
+    candidates = [dict(default_weights)]
+    if grid:
+        names = list(grid.keys())
+        for values in itertools.product(*(grid[name] for name in names)):
+            weights = dict(default_weights, **dict(zip(names, values)))
+            if weights not in candidates:
+                candidates.append(weights)
+    else:
+        for name, factor in itertools.product(default_weights, [0.5, 2]):
+            candidates.append(dict(default_weights, **{name: default_weights[name] * factor}))
+    return candidates
+
+
+if __name__ == "__main__":
+    # python tuner.py engine max_games workers [depth] [name=v1,v2,...]
+    engine = sys.argv[1]
+    max_games = int(sys.argv[2])
+    workers = int(sys.argv[3])
+    depth = 2
+    grid = {}
+    for arg in sys.argv[4:]:
+        if '=' in arg:
+            name, values = arg.split('=')
+            grid[name] = [float(value) for value in values.split(',')]
+        else:
+            depth = int(arg)
+    candidates = generate_candidates(ENGINES[engine][1].weights, grid)
+    print('engine:', engine)
+    print('candidates:', len(candidates))
+    print('max_games:', max_games)
+    start = time.time()
+    tuner = Tuner(engine, candidates, depth=depth, max_games=max_games, workers=workers)
+    best = tuner.tune()
+    end = time.time()
+    print(tuner.report())
+    print('time: ', end - start)
+    print('best weights:', best.weights)